@@ -15,9 +15,12 @@ import logging.handlers
 import os
 import sys
 import textwrap
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from importlib.metadata import version
 from pathlib import Path
-from typing import Final, Literal, cast
+from types import TracebackType
+from typing import Any, Final, Literal, Self, cast
 
 import aiohttp
 from dotenv import load_dotenv
@@ -47,17 +50,51 @@ from factorio_downloader.models import (
     SemVer,
 )
 
+_json_loads: Callable[[bytes], Any] = json.loads
+try:
+    import orjson  # type: ignore[import-not-found]
+except ImportError:
+    pass
+else:
+    _json_loads = orjson.loads
+
+_new_event_loop: Callable[[], asyncio.AbstractEventLoop] | None = None
+try:
+    import uvloop  # type: ignore[import-not-found]
+except ImportError:
+    pass
+else:
+    _new_event_loop = uvloop.new_event_loop
+
 MANIFEST_FILE: Final[str] = "manifest.json"
+PROGRESS_REFRESH_INTERVAL: Final[float] = 0.1
+LOG_PROGRESS_STEP: Final[int] = 10
+
+# Rank of each distro's download size, largest first. Starting the big ones first
+# keeps a single large file from finishing long after the rest. Distros missing here
+# start last.
+_DISTRO_SIZE_RANKS: Final[dict[FactorioDistro, int]] = {
+    FactorioDistro.OSX: 0,
+    FactorioDistro.WIN64_MANUAL: 1,
+    FactorioDistro.WIN64: 2,
+    FactorioDistro.LINUX64: 3,
+}
+
+
+def _distro_size_rank(distro: FactorioDistro) -> int:
+    return _DISTRO_SIZE_RANKS.get(distro, len(_DISTRO_SIZE_RANKS))
+
 
 _logger = logging.getLogger("factorio-downloader")
 
 
 async def get_latest_version(
+    session: aiohttp.ClientSession,
     build: FactorioBuild = FactorioBuild.EXPANSION,
 ) -> SemVer:
-    async with aiohttp.ClientSession() as s:
-        resp = await s.get(LATEST_RELEASE_URL)
-        version_info = await resp.json()
+    async with session.get(LATEST_RELEASE_URL) as resp:
+        resp.raise_for_status()
+        version_info = _json_loads(await resp.read())
     version_str = cast(str, version_info["stable"][build.value])
     return SemVer.from_str(version_str)
 
@@ -65,10 +102,69 @@ async def get_latest_version(
 def get_downloaded_version(version_file: Path) -> SemVer | None:
     if not version_file.is_file():
         return None
-    version_str = version_file.read_text().split()[0].strip()
+    version_str = version_file.read_text().strip().split(None, 1)[0]
     return SemVer.from_str(version_str)
 
 
+def get_manifest_version(manifest_file: Path) -> SemVer | None:
+    try:
+        manifest = DownloadManifest.model_validate_json(manifest_file.read_text())
+    except Exception:
+        return None
+    return manifest.download_version
+
+
+class _LogProgress:
+    """Stand-in for rich's Progress when output isn't going to a terminal.
+
+    Rather than redrawing bars, logs each task's progress every
+    LOG_PROGRESS_STEP percent.
+    """
+
+    def __init__(self) -> None:
+        self._descriptions: dict[TaskID, str] = {}
+        self._totals: dict[TaskID, float] = {}
+        self._logged_steps: dict[TaskID, int] = {}
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        pass
+
+    def add_task(self, description: str) -> TaskID:
+        task_id = TaskID(len(self._descriptions))
+        self._descriptions[task_id] = description
+        self._logged_steps[task_id] = -1
+        return task_id
+
+    def update(
+        self,
+        task_id: TaskID,
+        *,
+        total: float | None = None,
+        completed: float | None = None,
+        description: str | None = None,
+    ) -> None:
+        if description is not None:
+            self._descriptions[task_id] = description
+        if total:
+            self._totals[task_id] = total
+        task_total = self._totals.get(task_id)
+        if completed is None or not task_total:
+            return
+
+        step = int(completed * 100 / task_total) // LOG_PROGRESS_STEP
+        if step > self._logged_steps[task_id]:
+            self._logged_steps[task_id] = step
+            _logger.info(f"{self._descriptions[task_id]}: {step * LOG_PROGRESS_STEP}%")
+
+
 async def _run(
     build: FactorioBuild,
     factorio_version: str,
@@ -101,94 +197,130 @@ async def _run(
         download_dir = save_dir
 
     manifest_file = save_dir / MANIFEST_FILE
-    downloaded_version: SemVer | None = None
-    try:
-        manifest = DownloadManifest.model_validate_json(
-            (save_dir / MANIFEST_FILE).read_text()
-        )
-        downloaded_version = manifest.download_version
-    except Exception:
-        downloaded_version = None
 
-    if requested_version == "latest":
-        download_version: SemVer = await get_latest_version(build=build)
-        _logger.info(f"Latest version requested, downloading {download_version}.")
-    else:
-        download_version = requested_version
-
-    # No downloaded version means either our last DL was corrupted or it's our first run
-    if downloaded_version is not None:
-        if download_version == downloaded_version:
-            _logger.info(
-                f"Version {download_version} is already downloaded, nothing to do.",
-                extra={"style": "blue"},
-            )
-            sys.exit(0)
-
-    progress = Progress(
-        TextColumn("{task.description}"),
-        BarColumn(),
-        DownloadColumn(),
-        TransferSpeedColumn(),
-        TimeElapsedColumn(),
-        TimeRemainingColumn(),
+    # Every request goes to the same host, so keep enough warm connections around for
+    # the version check and all the downloads to share.
+    connector = aiohttp.TCPConnector(
+        limit_per_host=len(distros) + 1,
+        keepalive_timeout=120,
+        ttl_dns_cache=3600,
     )
+    async with aiohttp.ClientSession(connector=connector) as session:
+        # Start fetching the latest version while we check what's already on disk.
+        latest_task: asyncio.Task[SemVer] | None = None
+        if requested_version == "latest":
+            latest_task = asyncio.create_task(get_latest_version(session, build=build))
+        downloaded_version = await asyncio.to_thread(
+            get_manifest_version, manifest_file
+        )
 
-    # Remove version file while we wait, in case one of the tasks fails, so we can
-    # tell if the files are in a corrupted state. (TODO: Find checksums?)
-    manifest_file.unlink(missing_ok=True)
-    save_dir.mkdir(exist_ok=True)
+        if latest_task is not None:
+            download_version: SemVer = await latest_task
+            _logger.info(f"Latest version requested, downloading {download_version}.")
+        else:
+            download_version = cast(SemVer, requested_version)
+
+        # No downloaded version means either our last DL was corrupted or it's our first run
+        if downloaded_version is not None:
+            if download_version == downloaded_version:
+                _logger.info(
+                    f"Version {download_version} is already downloaded, nothing to do.",
+                    extra={"style": "blue"},
+                )
+                sys.exit(0)
+
+        progress: Progress | _LogProgress
+        if console.is_terminal:
+            progress = Progress(
+                TextColumn("{task.description}"),
+                BarColumn(),
+                DownloadColumn(),
+                TransferSpeedColumn(),
+                TimeElapsedColumn(),
+                TimeRemainingColumn(),
+                console=console,
+            )
+        else:
+            progress = _LogProgress()
 
-    with progress as progress:
+        # Remove version file while we wait, in case one of the tasks fails, so we can
+        # tell if the files are in a corrupted state.
+        manifest_file.unlink(missing_ok=True)
+        save_dir.mkdir(exist_ok=True)
 
-        def progress_update(
-            task_id: TaskID,
-            update_type: DownloadProgressUpdate,
-            data: DownloadProgressInfo,
-        ):
-            match update_type:
-                case DownloadProgressUpdate.GOT_FILE_SIZE:
-                    progress.update(
-                        task_id,
-                        description=f"Downloading {data.version}/{data.build}/{data.distro}",
-                        total=data.total_size,
-                    )
-                case DownloadProgressUpdate.DOWNLOADED_CHUNK:
-                    progress.update(task_id, completed=data.downloaded)
-                case DownloadProgressUpdate.FILE_ALREADY_DOWNLOADED:
-                    description = f"{data.version}/{data.build}/{data.distro} is already downloaded."
-                    progress.update(
-                        task_id, description=description, completed=data.total_size
-                    )
-                case DownloadProgressUpdate.COMPLETED:
-                    final_description = "{data.distro} download complete!"
-                    progress.update(
-                        task_id,
-                        completed=data.total_size,
-                        description=final_description,
-                    )
-
-        async with (
-            aiohttp.ClientSession() as session,
-            asyncio.TaskGroup() as tg,
-            FactorioDownloader(
-                username, token, save_dir, download_dir=download_dir, session=session
-            ) as downloader,
+        with (
+            progress as progress,
+            ThreadPoolExecutor(max_workers=len(distros)) as write_executor,
         ):
-            download_tasks: dict[FactorioDistro, asyncio.Task[Path]] = {}
-            for distro in distros:
-                task = progress.add_task(
-                    f"Downloading {download_version}/{build}/{distro}"
-                )
-                progress_callback = functools.partial(progress_update, task)
-                download_tasks[distro] = tg.create_task(
-                    downloader.download(
-                        distro,
-                        download_version,
-                        build,
-                        progress_callback=progress_callback,
-                    )
-                )
+            # Downloads in flight. Their byte counts are sampled by refresh_progress
+            # rather than pushed into the progress bars on every chunk.
+            active_downloads: dict[TaskID, DownloadProgressInfo] = {}
+
+            def progress_update(
+                task_id: TaskID,
+                update_type: DownloadProgressUpdate,
+                data: DownloadProgressInfo,
+            ):
+                match update_type:
+                    case DownloadProgressUpdate.GOT_FILE_SIZE:
+                        active_downloads[task_id] = data
+                        progress.update(
+                            task_id,
+                            description=f"Downloading {data.version}/{data.build}/{data.distro}",
+                            total=data.total_size,
+                        )
+                    case DownloadProgressUpdate.FILE_ALREADY_DOWNLOADED:
+                        active_downloads.pop(task_id, None)
+                        description = f"{data.version}/{data.build}/{data.distro} is already downloaded."
+                        progress.update(
+                            task_id, description=description, completed=data.total_size
+                        )
+                    case DownloadProgressUpdate.COMPLETED:
+                        active_downloads.pop(task_id, None)
+                        final_description = f"{data.distro} download complete!"
+                        progress.update(
+                            task_id,
+                            completed=data.total_size,
+                            description=final_description,
+                        )
+
+            async def refresh_progress():
+                while True:
+                    await asyncio.sleep(PROGRESS_REFRESH_INTERVAL)
+                    for task_id, data in active_downloads.items():
+                        progress.update(task_id, completed=data.downloaded)
+
+            refresh_task = asyncio.create_task(refresh_progress())
+
+            try:
+                async with (
+                    asyncio.TaskGroup() as tg,
+                    FactorioDownloader(
+                        username,
+                        token,
+                        save_dir,
+                        download_dir=download_dir,
+                        session=session,
+                        write_executor=write_executor,
+                    ) as downloader,
+                ):
+                    download_tasks: dict[FactorioDistro, asyncio.Task[Path]] = {}
+                    for distro in sorted(distros, key=_distro_size_rank):
+                        task = progress.add_task(
+                            f"Downloading {download_version}/{build}/{distro}"
+                        )
+                        progress_callback = functools.partial(progress_update, task)
+                        download_tasks[distro] = tg.create_task(
+                            downloader.download(
+                                distro,
+                                download_version,
+                                build,
+                                progress_callback=progress_callback,
+                            )
+                        )
+            finally:
+                refresh_task.cancel()
+                await asyncio.wait([refresh_task])
     for distro, task in download_tasks.items():
         save_file = task.result()
         console.print(f"Saved {download_version}/{build}/{distro} to {save_file}.")
@@ -202,22 +334,28 @@ async def _run(
     manifest_file.write_text(json.dumps(updated_manifest.model_dump_json()))
 
 
-def main():
-    cmd_description = (
+_CMD_DESCRIPTION: Final[str] = "\n".join(
+    textwrap.wrap(
         "Download Factorio binaries from the official site.\n\n"
         "You must set your Factorio username and token (see Token on "
         "https://factorio.com/profile) and set them as the environment variables "
         "FACTORIO_USERNAME and FACTORIO_TOKEN, respectively. These can be provided "
-        "as a .env file."
-    )
-    parser = argparse.ArgumentParser(
-        description="\n".join(textwrap.wrap(cmd_description, width=70))
+        "as a .env file.",
+        width=70,
     )
+)
+_BUILD_CHOICES: Final[list[str]] = [b.value for b in FactorioBuild]
+_ALL_DISTROS: Final[list[FactorioDistro]] = list(FactorioDistro)
+
+
+@functools.cache
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=_CMD_DESCRIPTION)
     parser.add_argument(
         "--build",
         "-b",
         default=FactorioBuild.EXPANSION,
-        choices=[b.value for b in FactorioBuild],
+        choices=_BUILD_CHOICES,
         type=FactorioBuild,
         help="The build of the game to download. Defaults to 'expansion', which includes Space Age.",
     )
@@ -231,7 +369,7 @@ def main():
         "--distro",
         "-d",
         action="append",
-        default=[d for d in FactorioDistro],
+        default=_ALL_DISTROS,
         type=FactorioDistro,
         help=(
             "The platform(s) to download executables for. May be provided multiple "
@@ -259,7 +397,11 @@ def main():
     )
     parser.add_argument("--quiet", "-q", action="store_true", help="Disable output.")
 
-    args = parser.parse_args()
+    return parser
+
+
+def main():
+    args = _build_parser().parse_args()
 
     logger = logging.getLogger("factorio-downloader")
     logger.setLevel(logging.DEBUG)
@@ -291,7 +433,8 @@ def main():
                 args.outdir,
                 args.tempdir,
                 console,
-            )
+            ),
+            loop_factory=_new_event_loop,
         )
     except Exception:
         _logger.exception("Failed to download")
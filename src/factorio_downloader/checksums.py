@@ -44,15 +44,21 @@ class FactorioValidFileChecker:
         if not factorio_file.is_file():
             return FileCheckResult.FILE_MISSING
         file_name = factorio_file.name
-        expected_file_checksum = self.checksums.get(file_name)
-        if expected_file_checksum is None:
+        if file_name not in self.checksums:
             return FileCheckResult.INVALID_FILE_NAME
 
         with factorio_file.open("rb") as f:
             file_checkusm = hashlib.file_digest(f, "sha256").hexdigest()
 
+        return self.check_digest(file_name, file_checkusm)
+
+    def check_digest(self, file_name: str, sha256: str) -> FileCheckResult:
+        """Check an already-computed SHA-256 hex digest for the file ``file_name``."""
+        expected_file_checksum = self.checksums.get(file_name)
+        if expected_file_checksum is None:
+            return FileCheckResult.INVALID_FILE_NAME
         return (
             FileCheckResult.VALID
-            if file_checkusm == expected_file_checksum
+            if sha256 == expected_file_checksum
             else FileCheckResult.CHECKSUM_MISMATCH
         )
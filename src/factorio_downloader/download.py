@@ -1,7 +1,11 @@
+import asyncio
+import hashlib
+import os
+from concurrent.futures import Executor
 from dataclasses import dataclass
 from enum import Enum, auto
 from pathlib import Path
-from typing import Callable
+from typing import Any, Callable, Final
 
 from aiohttp import ClientSession
 
@@ -9,6 +13,104 @@ from factorio_downloader._urls import DOWNLOAD_URL_TEMPLATE
 from factorio_downloader.checksums import FactorioValidFileChecker, FileCheckResult
 from factorio_downloader.models import FactorioBuild, FactorioDistro, SemVer
 
+WRITE_BUFFER_SIZE: Final[int] = 1 << 22
+# How often DOWNLOADED_CHUNK callbacks fire. Callers that poll
+# DownloadProgressInfo.downloaded themselves, like fdl's progress bars, can ignore
+# them.
+PROGRESS_UPDATE_SIZE: Final[int] = 4 << 20
+
+_WRITE_FLAGS: Final[int] = (
+    os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+)
+
+
+def _get_iov_max() -> int:
+    try:
+        iov_max = os.sysconf("SC_IOV_MAX")
+    except (AttributeError, ValueError, OSError):
+        iov_max = -1
+    # 1024 is the usual limit, and POSIX requires at least 16.
+    return iov_max if iov_max > 0 else 1024
+
+
+_IOV_MAX: Final[int] = _get_iov_max()
+
+
+def _write_all(fd: int, buffers: list[bytes]) -> None:
+    """Write all of ``buffers`` to ``fd``, using one vectored write where possible."""
+    if not hasattr(os, "writev"):
+        data = memoryview(b"".join(buffers))
+        while data:
+            data = data[os.write(fd, data) :]
+        return
+
+    views = [memoryview(b) for b in buffers]
+    start = 0
+    while start < len(views):
+        # writev rejects more than IOV_MAX buffers per call with EINVAL.
+        written = os.writev(fd, views[start : start + _IOV_MAX])
+        # Short writes are rare for regular files, but skip whatever made it out.
+        while start < len(views) and written >= len(views[start]):
+            written -= len(views[start])
+            start += 1
+        if written:
+            views[start] = views[start][written:]
+
+
+def _write_and_hash(fd: int, buffers: list[bytes], file_hash: "hashlib._Hash") -> None:
+    for buffer in buffers:
+        file_hash.update(buffer)
+    _write_all(fd, buffers)
+
+
+def _preallocate(fd: int, size: int | None) -> bool:
+    """Reserve ``size`` bytes for ``fd`` up front, if the platform supports it."""
+    if not size or not hasattr(os, "posix_fallocate"):
+        return False
+    try:
+        # Where the filesystem doesn't support fallocate, glibc emulates it by writing
+        # to every block of the file, so this can take as long as a full write pass.
+        os.posix_fallocate(fd, 0, size)
+    except OSError:
+        # Other platforms may just fail instead, and it's only an optimization.
+        return False
+    return True
+
+
+def _drop_from_page_cache(fd: int) -> None:
+    """Flush ``fd`` to disk and tell the kernel we won't be reading it back."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    # DONTNEED only evicts clean pages, so they need to be written out first.
+    os.fsync(fd)
+    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def _open_unnamed_file(directory: Path) -> int | None:
+    """Open an unnamed file in ``directory``, or ``None`` if that isn't supported.
+
+    The file can later be given a name with ``_link_unnamed_file``. Until then, it
+    disappears if the process dies.
+    """
+    if not hasattr(os, "O_TMPFILE") or not os.path.isdir("/proc/self/fd"):
+        return None
+    try:
+        return os.open(directory, os.O_TMPFILE | os.O_WRONLY, 0o644)
+    except OSError:
+        # Not every filesystem supports O_TMPFILE.
+        return None
+
+
+def _link_unnamed_file(fd: int, path: Path) -> None:
+    path.unlink(missing_ok=True)
+    # os.link only calls linkat(..., AT_SYMLINK_FOLLOW), which we need to follow the
+    # /proc symlink to the file, when given a dir fd. Otherwise it uses plain link().
+    dir_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.link(f"/proc/self/fd/{fd}", path.name, dst_dir_fd=dir_fd)
+    finally:
+        os.close(dir_fd)
+
 
 class DownloadProgressUpdate(Enum):
     START = auto()
@@ -36,6 +138,7 @@ class FactorioDownloader:
         save_dir: Path,
         download_dir: Path | None = None,
         session: ClientSession | None = None,
+        write_executor: Executor | None = None,
     ):
         self._username: str = username
         self._token: str = token
@@ -43,6 +146,8 @@ class FactorioDownloader:
         self._manual_session = session is None
         self._save_dir = save_dir
         self._download_dir = download_dir
+        # None means the event loop's default executor.
+        self._write_executor = write_executor
 
         self._file_checker: FactorioValidFileChecker | None = None
 
@@ -114,26 +219,107 @@ class FactorioDownloader:
             save_file = self._save_dir / file_name
             progress_info.save_file = save_file
 
-            file_check_result = self.file_checker.check_file(save_file)
+            # Hashing a large file would otherwise block the other downloads.
+            file_check_result = await asyncio.to_thread(
+                self.file_checker.check_file, save_file
+            )
             # FILE_MISSING or INVALID_CHECKSUM both mean we should (re)download the file.
             if file_check_result == FileCheckResult.VALID:
                 trigger_callback(DownloadProgressUpdate.FILE_ALREADY_DOWNLOADED)
                 return save_file
-            elif file_check_result == FileCheckResult.INVALID_FILE_NAME:
-                msg = f"Wanted to save file to {file_check_result}, but it's not a valid Factorio file."
+            # check_file reports a missing file before looking at its name, so check the
+            # name separately rather than finding out after the whole download.
+            elif (
+                file_check_result == FileCheckResult.INVALID_FILE_NAME
+                or save_file.name not in self.file_checker.checksums
+            ):
+                msg = f"Wanted to save file to {save_file}, but it's not a valid Factorio file."
                 raise RuntimeError(msg)
 
+            # Without a separate download dir, write to an unnamed file that only shows
+            # up as save_file once it's complete. Otherwise use a named temp file.
             download_dir = self._download_dir or self._save_dir
-            download_file = download_dir / (save_file.name + ".tmp")
-            download_file.unlink(missing_ok=True)
+            download_file: Path | None = None
+            fd = (
+                _open_unnamed_file(download_dir)
+                if download_dir == self._save_dir
+                else None
+            )
+            if fd is None:
+                download_file = download_dir / (save_file.name + ".tmp")
+                fd = os.open(download_file, _WRITE_FLAGS, 0o644)
+
+            # progress_info.downloaded is always current, but callbacks are batched
+            # so the renderer isn't hit on every chunk. Writes are batched too, so
+            # several chunks go out in a single syscall.
+            pending = 0
+            buffers: list[bytes] = []
+            loop = asyncio.get_running_loop()
+            buffered = 0
+            io_future: asyncio.Future[Any] | None = None
+            # Hashed as it's written, so the file can be verified before it's saved.
+            file_hash = hashlib.sha256()
+
+            async def run_io[T](func: Callable[..., T], *args: object) -> T:
+                # Shielded so that if we're cancelled, io_future still tracks the
+                # worker thread, which can't be interrupted.
+                nonlocal io_future
+                future = loop.run_in_executor(self._write_executor, func, *args)
+                io_future = future
+                return await asyncio.shield(future)
 
-            with download_file.open("wb") as f:
-                async for chunk in download_resp.content.iter_chunked(163_840):
-                    f.write(chunk)
+            try:
+                preallocated = await run_io(_preallocate, fd, progress_info.total_size)
+                # iter_any hands back aiohttp's own buffers as-is, where iter_chunked
+                # would join them into new bytes objects of the requested size.
+                async for chunk in download_resp.content.iter_any():
+                    buffers.append(chunk)
+                    buffered += len(chunk)
+                    # iter_any's chunk sizes aren't bounded, so on a slow link a batch
+                    # can fill up with many small buffers before reaching the byte
+                    # limit. Keep each batch to a single writev.
+                    if buffered >= WRITE_BUFFER_SIZE or len(buffers) >= _IOV_MAX:
+                        await run_io(_write_and_hash, fd, buffers, file_hash)
+                        buffers = []
+                        buffered = 0
                     progress_info.downloaded += len(chunk)
+                    pending += len(chunk)
+                    if pending >= PROGRESS_UPDATE_SIZE:
+                        pending = 0
+                        trigger_callback(DownloadProgressUpdate.DOWNLOADED_CHUNK)
+                if buffers:
+                    await run_io(_write_and_hash, fd, buffers, file_hash)
+                if pending:
                     trigger_callback(DownloadProgressUpdate.DOWNLOADED_CHUNK)
+                if (
+                    preallocated
+                    and progress_info.downloaded != progress_info.total_size
+                ):
+                    # Don't leave reserved-but-unwritten space on the end of the file.
+                    await run_io(os.ftruncate, fd, progress_info.downloaded)
+
+                file_check_result = self.file_checker.check_digest(
+                    save_file.name, file_hash.hexdigest()
+                )
+                if file_check_result == FileCheckResult.VALID:
+                    await run_io(_drop_from_page_cache, fd)
+                    if download_file is None:
+                        _link_unnamed_file(fd, save_file)
+            finally:
+                # Don't close fd out from under a worker that's still using it.
+                if io_future is not None:
+                    await asyncio.wait([io_future])
+                os.close(fd)
+
+            if file_check_result != FileCheckResult.VALID:
+                # An unnamed file just disappears once it's closed. A named one has to
+                # be closed before it can be deleted on Windows.
+                if download_file is not None:
+                    download_file.unlink()
+                msg = f"Downloaded {save_file.name}, but it failed verification ({file_check_result.name})."
+                raise RuntimeError(msg)
 
-            save_file.unlink(missing_ok=True)
-            download_file.rename(save_file)
+            if download_file is not None:
+                download_file.replace(save_file)
             trigger_callback(DownloadProgressUpdate.COMPLETED)
-        return download_file
+        return save_file
@@ -29,13 +29,12 @@ class SemVer(NamedTuple):
 
     @staticmethod
     def from_str(semver_str: str) -> "SemVer":
-        fields = semver_str.split(".")
-        if len(fields) != 3:
+        fields = semver_str.split(".", 2)
+        if len(fields) != 3 or "." in fields[2]:
             raise ValueError(
                 "semver_str should be a string in format <major>.<minor>.<patch>"
             )
-        fields_int = [int(f) for f in fields]
-        return SemVer(major=fields_int[0], minor=fields_int[1], patch=fields_int[2])
+        return SemVer(*map(int, fields))
 
 
 def ensure_semver(value: Any) -> Any:
@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+
+from factorio_downloader import download
+from factorio_downloader.checksums import FactorioValidFileChecker
+from factorio_downloader.download import FactorioDownloader, _write_all
+from factorio_downloader.models import FactorioBuild, FactorioDistro, SemVer
+
+
+def _write_to_file(path: Path, buffers: list[bytes]) -> bytes:
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        _write_all(fd, buffers)
+    finally:
+        os.close(fd)
+    return path.read_bytes()
+
+
+def test_write_all_more_buffers_than_iov_max(tmp_path: Path):
+    buffers = [bytes([i % 256]) * 10 for i in range(download._IOV_MAX * 3 + 7)]
+    assert _write_to_file(tmp_path / "out", buffers) == b"".join(buffers)
+
+
+@pytest.mark.skipif(not hasattr(os, "writev"), reason="needs os.writev")
+def test_write_all_short_writes(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    real_writev = os.writev
+    batch_sizes: list[int] = []
+
+    def short_writev(fd: int, buffers: list[memoryview]) -> int:
+        batch_sizes.append(len(buffers))
+        # Only ever write part of the first buffer.
+        first = buffers[0]
+        return real_writev(fd, [first[: max(1, len(first) // 2)]])
+
+    monkeypatch.setattr(os, "writev", short_writev)
+    buffers = [b"abc", b"", b"defghij", b"k" * 100]
+    assert _write_to_file(tmp_path / "out", buffers) == b"".join(buffers)
+    assert max(batch_sizes) <= download._IOV_MAX
+
+
+def _download(
+    save_dir: Path,
+    body: bytes,
+    checksums: dict[str, str],
+    download_dir: Path | None = None,
+    piece_size: int = 65536,
+) -> Path:
+    async def handler(request: web.Request) -> web.StreamResponse:
+        resp = web.StreamResponse(headers={"content-length": str(len(body))})
+        await resp.prepare(request)
+        for i in range(0, len(body), piece_size):
+            await resp.write(body[i : i + piece_size])
+            # Let the client read each piece on its own, like on a slow link.
+            await asyncio.sleep(0)
+        return resp
+
+    async def run() -> Path:
+        app = web.Application()
+        route = "/get-download/{version}/{build}/{distro}"
+        app.router.add_get(route, handler)
+        async with TestServer(app) as server, ClientSession() as session:
+            url_template = str(server.make_url("/")) + route.lstrip("/")
+            with patch.object(download, "DOWNLOAD_URL_TEMPLATE", url_template):
+                downloader = FactorioDownloader(
+                    "user",
+                    "token",
+                    save_dir,
+                    download_dir=download_dir,
+                    session=session,
+                )
+                downloader._file_checker = FactorioValidFileChecker(checksums)
+                return await downloader.download(
+                    FactorioDistro.LINUX64, SemVer(2, 0, 0), FactorioBuild.EXPANSION
+                )
+
+    return asyncio.run(run())
+
+
+def test_download_saves_verified_file(tmp_path: Path):
+    body = os.urandom(3_000_000)
+    save_file = _download(tmp_path, body, {"linux64": hashlib.sha256(body).hexdigest()})
+    assert save_file == tmp_path / "linux64"
+    assert save_file.read_bytes() == body
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["linux64"]
+
+
+def test_download_with_separate_download_dir(tmp_path: Path):
+    save_dir = tmp_path / "save"
+    download_dir = tmp_path / "download"
+    save_dir.mkdir()
+    download_dir.mkdir()
+    body = os.urandom(3_000_000)
+
+    save_file = _download(
+        save_dir,
+        body,
+        {"linux64": hashlib.sha256(body).hexdigest()},
+        download_dir=download_dir,
+    )
+    assert save_file == save_dir / "linux64"
+    assert save_file.read_bytes() == body
+    assert list(download_dir.iterdir()) == []
+
+
+def test_download_many_small_chunks(tmp_path: Path):
+    body = os.urandom(5_000_000)
+    save_file = _download(
+        tmp_path, body, {"linux64": hashlib.sha256(body).hexdigest()}, piece_size=1024
+    )
+    assert save_file.read_bytes() == body
+
+
+@pytest.mark.parametrize("separate_download_dir", [False, True])
+def test_download_checksum_mismatch_is_not_saved(
+    tmp_path: Path, separate_download_dir: bool
+):
+    save_dir = tmp_path / "save"
+    save_dir.mkdir()
+    download_dir = None
+    if separate_download_dir:
+        download_dir = tmp_path / "download"
+        download_dir.mkdir()
+
+    with pytest.raises(RuntimeError, match="CHECKSUM_MISMATCH"):
+        _download(
+            save_dir,
+            os.urandom(100_000),
+            {"linux64": "0" * 64},
+            download_dir=download_dir,
+        )
+    assert [p.name for p in tmp_path.rglob("*") if p.is_file()] == []
+
+
+def test_download_unknown_file_name_fails_before_writing(tmp_path: Path):
+    with (
+        patch.object(download, "_write_and_hash") as write_and_hash,
+        pytest.raises(RuntimeError, match="not a valid Factorio file"),
+    ):
+        _download(tmp_path, os.urandom(100_000), {"osx": "0" * 64})
+    write_and_hash.assert_not_called()
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,49 @@
+import logging
+
+import pytest
+
+from factorio_downloader.__main__ import _LogProgress
+
+
+@pytest.fixture(autouse=True)
+def _capture_logs(caplog: pytest.LogCaptureFixture):
+    caplog.set_level(logging.INFO, logger="factorio-downloader")
+
+
+def test_log_progress_logs_each_step_once(caplog: pytest.LogCaptureFixture):
+    with _LogProgress() as progress:
+        task_id = progress.add_task("linux64")
+        progress.update(task_id, total=1000)
+        for completed in range(0, 1001, 5):
+            progress.update(task_id, completed=completed)
+
+    assert caplog.messages == [f"linux64: {pct}%" for pct in range(0, 101, 10)]
+
+
+def test_log_progress_total_after_add_task(caplog: pytest.LogCaptureFixture):
+    progress = _LogProgress()
+    task_id = progress.add_task("Waiting")
+    progress.update(task_id, completed=50)
+    assert caplog.messages == []
+
+    progress.update(task_id, total=100, description="linux64")
+    progress.update(task_id, completed=50)
+    assert caplog.messages == ["linux64: 50%"]
+
+
+def test_log_progress_zero_total(caplog: pytest.LogCaptureFixture):
+    progress = _LogProgress()
+    task_id = progress.add_task("linux64")
+    progress.update(task_id, total=0, completed=0)
+    assert caplog.messages == []
+
+
+def test_log_progress_tracks_tasks_separately(caplog: pytest.LogCaptureFixture):
+    progress = _LogProgress()
+    first = progress.add_task("osx")
+    second = progress.add_task("linux64")
+    progress.update(first, total=10, completed=10)
+    progress.update(second, total=10, completed=3)
+    progress.update(first, completed=10)
+
+    assert caplog.messages == ["osx: 100%", "linux64: 30%"]